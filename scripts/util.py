@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import http.client
 import httplib2
 import importlib.util
 import inspect
@@ -29,6 +30,7 @@ import socket
 import subprocess
 import sys
 import tempfile
+import threading
 from collections import defaultdict, namedtuple
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
@@ -36,10 +38,10 @@ from functools import lru_cache, reduce, partialmethod
 from itertools import chain, compress, islice
 from pathlib import Path
 from time import sleep, time
+from urllib.parse import urlsplit
 
 required_modules = [
     ("googleapiclient", "google-api-python-client"),
-    ("requests", "requests"),
     ("yaml", "yaml"),
     ("addict", "addict"),
 ]
@@ -58,12 +60,15 @@ import googleapiclient.discovery  # noqa: E402
 import google_auth_httplib2  # noqa: E402
 from googleapiclient.http import set_user_agent  # noqa: E402
 
-from requests import get as get_url  # noqa: E402
-from requests.exceptions import RequestException  # noqa: E402
-
 import yaml  # noqa: E402
 from addict import Dict as NSDict  # noqa: E402
 
+# prefer the libyaml bindings, fall back to pure-Python if PyYAML lacks them
+try:
+    from yaml import CSafeLoader as _YLoader, CSafeDumper as _YDumperBase
+except ImportError:
+    from yaml import SafeLoader as _YLoader, SafeDumper as _YDumperBase
+
 optional_modules = [
     ("google.cloud.pubsub", "google-cloud-pubsub"),
     ("google.cloud.secretmanager", "google-cloud-secret-manager"),
@@ -442,17 +447,20 @@ def new_config(config):
     """
     cfg = load_config_data(config)
 
-    network_storage_iter = filter(
-        None,
-        (
-            *cfg.network_storage,
-            *cfg.login_network_storage,
-            *chain.from_iterable(p.network_storage for p in cfg.partitions.values()),
-        ),
+    # use get() so missing keys don't build throwaway empty NSDicts
+    control_host = cfg.slurm_control_host
+    network_storage_groups = [
+        cfg.get("network_storage"),
+        cfg.get("login_network_storage"),
+    ]
+    network_storage_groups.extend(
+        p.get("network_storage") for p in (cfg.get("partitions") or {}).values()
     )
-    for netstore in network_storage_iter:
-        if netstore.server_ip is None or netstore.server_ip == "$controller":
-            netstore.server_ip = cfg.slurm_control_host
+    for network_storage in network_storage_groups:
+        for netstore in filter(None, network_storage or ()):
+            server_ip = netstore.get("server_ip")
+            if server_ip is None or server_ip == "$controller":
+                netstore.server_ip = control_host
     return cfg
 
 
@@ -473,7 +481,7 @@ def config_from_metadata():
             break
     else:
         config_yaml = instance_metadata("attributes/slurm-config")
-    cfg = new_config(yaml.safe_load(config_yaml or ""))
+    cfg = new_config(yaml.load(config_yaml or "", Loader=_YLoader))
     return cfg
 
 
@@ -481,7 +489,8 @@ def load_config_file(path):
     """load config from file"""
     content = None
     try:
-        content = yaml.safe_load(Path(path).read_text())
+        with Path(path).open("rb") as f:
+            content = yaml.load(f, Loader=_YLoader)
     except FileNotFoundError:
         log.warning(f"config file not found: {path}")
         return NSDict()
@@ -489,8 +498,27 @@ def load_config_file(path):
 
 
 def save_config(cfg, path):
-    """save given config to file at path"""
-    Path(path).write_text(yaml.dump(cfg, Dumper=Dumper))
+    """save given config to file at path
+    the config is written to a temp file that then replaces path, so readers
+    never see a partially written config
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            yaml.dump(cfg, f, Dumper=Dumper)
+        # keep the mode and ownership of the config being replaced
+        if path.exists():
+            st = path.stat()
+            os.chmod(tmp, st.st_mode & 0o7777)
+            try:
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 
 def filter_logging_flags(record):
@@ -588,6 +616,12 @@ def handle_exception(exc_type, exc_value, exc_trace):
     sys.__excepthook__(exc_type, exc_value, exc_trace)
 
 
+@lru_cache(maxsize=256)
+def split_cmd(cmd):
+    """shlex.split with caching, for commands that are run repeatedly"""
+    return tuple(shlex.split(cmd))
+
+
 def run(
     args,
     stdout=subprocess.PIPE,
@@ -595,15 +629,22 @@ def run(
     shell=False,
     timeout=None,
     check=True,
-    universal_newlines=True,
+    universal_newlines=None,
     **kwargs,
 ):
-    """Wrapper for subprocess.run() with convenient defaults"""
+    """Wrapper for subprocess.run() with convenient defaults
+    text mode is used by default only if output is captured or input is a str
+    """
+    text_args = ("text", "encoding", "errors")
+    if universal_newlines is None and not any(a in kwargs for a in text_args):
+        universal_newlines = subprocess.PIPE in (stdout, stderr) or isinstance(
+            kwargs.get("input"), str
+        )
     if isinstance(args, list):
         args = list(filter(lambda x: x is not None, args))
         args = " ".join(args)
     if not shell and isinstance(args, str):
-        args = shlex.split(args)
+        args = list(split_cmd(args))
     log_subproc.debug(f"run: {args}")
     result = subprocess.run(
         args,
@@ -622,7 +663,7 @@ def spawn(cmd, quiet=False, shell=False, **kwargs):
     """nonblocking spawn of subprocess"""
     if not quiet:
         log_subproc.debug(f"spawn: {cmd}")
-    args = cmd if shell else shlex.split(cmd)
+    args = cmd if shell else list(split_cmd(cmd))
     return subprocess.Popen(args, shell=shell, **kwargs)
 
 
@@ -649,7 +690,7 @@ def chown_slurm(path, mode=None):
 @contextmanager
 def cd(path):
     """Change working directory for context"""
-    prev = Path.cwd()
+    prev = os.getcwd()
     os.chdir(path)
     try:
         yield
@@ -666,8 +707,24 @@ def with_static(**kwargs):
     return decorate
 
 
-def cached_property(f):
-    return property(lru_cache()(f))
+class cached_property:
+    """Compute an attribute once per instance and store it in the instance
+    __dict__, so later lookups don't go through the descriptor at all"""
+
+    __slots__ = ("func", "attr_name")
+
+    def __init__(self, func):
+        self.func = func
+        self.attr_name = func.__name__
+
+    def __set_name__(self, owner, name):
+        self.attr_name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.attr_name] = self.func(instance)
+        return value
 
 
 def separate(pred, coll):
@@ -767,17 +824,42 @@ def backoff_delay(start, count: int, timeout=None, ratio=None):
 ROOT_URL = "http://metadata.google.internal/computeMetadata/v1"
 
 
+METADATA_TIMEOUT = 10
+metadata_conns = threading.local()
+
+
+def metadata_connection(host):
+    """HTTP connection to host, kept alive and reused within each thread"""
+    conns = metadata_conns.__dict__.setdefault("conns", {})
+    if host not in conns:
+        conns[host] = http.client.HTTPConnection(host, timeout=METADATA_TIMEOUT)
+    return conns[host]
+
+
 def get_metadata(path, root=ROOT_URL):
     """Get metadata relative to metadata/computeMetadata/v1"""
     HEADERS = {"Metadata-Flavor": "Google"}
     url = f"{root}/{path}"
-    try:
-        resp = get_url(url, headers=HEADERS)
-        resp.raise_for_status()
-        return resp.text
-    except RequestException:
+    parts = urlsplit(url)
+    target = f"{parts.path}?{parts.query}" if parts.query else parts.path
+    conn = metadata_connection(parts.netloc)
+    # the server may have dropped the kept-alive connection, so retry once on
+    # a fresh one before giving up
+    for _ in range(2):
+        try:
+            conn.request("GET", target, headers=HEADERS)
+            resp = conn.getresponse()
+            content = resp.read()
+            break
+        except (OSError, http.client.HTTPException):
+            conn.close()
+    else:
         log.error(f"Error while getting metadata from {url}")
         return None
+    if resp.status != http.client.OK:
+        log.error(f"Error while getting metadata from {url}: {resp.status}")
+        return None
+    return content.decode()
 
 
 @lru_cache(maxsize=None)
@@ -1035,14 +1117,9 @@ def get_insert_operations(group_ids, flt=None, project=None, compute=compute):
     return get_filtered_operations(" AND ".join(f"({f})" for f in filters if f))
 
 
-class Dumper(yaml.SafeDumper):
+class Dumper(_YDumperBase):
     """Add representers for pathlib.Path and NSDict for yaml serialization"""
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.add_representer(NSDict, self.represent_nsdict)
-        self.add_multi_representer(Path, self.represent_path)
-
     @staticmethod
     def represent_nsdict(dumper, data):
         return dumper.represent_mapping("tag:yaml.org,2002:map", data.items())
@@ -1052,6 +1129,10 @@ class Dumper(yaml.SafeDumper):
         return dumper.represent_scalar("tag:yaml.org,2002:str", str(path))
 
 
+Dumper.add_representer(NSDict, Dumper.represent_nsdict)
+Dumper.add_multi_representer(Path, Dumper.represent_path)
+
+
 class Lookup:
     """Wrapper class for cached data access"""
 